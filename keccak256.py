@@ -2,12 +2,27 @@
 """
 Python implementation of keccak256 (Ethereum-style, not NIST SHA3-256).
 Computes keccak256 of the string that's hardcoded in main().
+
+KeccakHash and keccak256() hand their work to pysha3 (or its safe-pysha3
+fork) when it is installed, and keccak256() falls back to pycryptodome.
+Otherwise the sponge here runs Keccak-f[1600] on the first available
+backend: c, the libkeccak_f1600 library built by hand from keccak_f1600.c
+(see the build line there) and placed next to this file; xkcp, an
+installed XKCP library; numba, with NumPy and Numba installed; python.
+The KECCAK_BACKEND environment variable names one of these to force it,
+which also skips the native hashes; the default is "auto". The module
+attribute backend names the permutation in use, and keccak_c_isa the code
+path the C library picked for this CPU.
 """
 
+import ctypes
+import os
+import sys
+import threading
+from array import array
+from functools import lru_cache
 from operator import xor
-from copy import deepcopy
-from functools import reduce
-from math import log
+from struct import pack, unpack, unpack_from
 
 # --------------------------------------------------------------------
 #                          Constants & Helpers
@@ -30,93 +45,404 @@ RotationConstants = [
     [18, 2, 61, 56, 14],
 ]
 
-Masks = [(1 << i) - 1 for i in range(65)]
+Mask64 = 0xFFFFFFFFFFFFFFFF
 
 def bits2bytes(x):
     return (x + 7) // 8
 
-def rol(value, left, bits):
-    top = value >> (bits - left)
-    bot = (value & Masks[bits - left]) << left
-    return bot | top
+def padding_bytes(padlen):
+    if padlen == 1:
+        return b"\x81"
+    else:
+        return b"\x01" + b"\x00" * (padlen - 2) + b"\x80"
+
+# Padding depends only on its length, so each distinct one is built once:
+# every length keccak256's 136-byte rate can need up front, others lazily.
+PaddingCache = {padlen: padding_bytes(padlen) for padlen in range(1, 137)}
 
 def multirate_padding(used_bytes, align_bytes):
     padlen = align_bytes - used_bytes
     if padlen == 0:
         padlen = align_bytes
-    if padlen == 1:
-        return [0x81]
-    else:
-        return [0x01] + ([0x00] * (padlen - 2)) + [0x80]
+    pad = PaddingCache.get(padlen)
+    if pad is None:
+        pad = PaddingCache[padlen] = padding_bytes(padlen)
+    return pad
 
 # --------------------------------------------------------------------
 #                          Keccak Permutation
 # --------------------------------------------------------------------
 
-def keccak_f(state):
-    def keccak_round(a, rc):
-        w, h = state.W, state.H
-        rangew, rangeh = state.rangeW, state.rangeH
-        lanew = state.lanew
-        zero = state.zero
-
+# Keccak-f[1600] on a flat mutable sequence of 25 lanes, lane (x, y) at s[x + 5*y].
+# The lanes live in locals for all 24 rounds and the round body is written
+# out with every lane index and rotation offset fixed at its constant, so the
+# same source also compiles under Numba into register-resident straight-line
+# code (round_constants is then passed as a uint64 array).
+def keccak_f1600(s, round_constants=RoundConstants):
+    mask = Mask64
+    (
+        a00, a10, a20, a30, a40,
+        a01, a11, a21, a31, a41,
+        a02, a12, a22, a32, a42,
+        a03, a13, a23, a33, a43,
+        a04, a14, a24, a34, a44,
+    ) = s
+
+    for rc in round_constants:
         # Theta
-        c = [reduce(xor, a[x]) for x in rangew]
-        d = [0] * w
-        for x in rangew:
-            d[x] = c[(x - 1) % w] ^ rol(c[(x + 1) % w], 1, lanew)
-            for y in rangeh:
-                a[x][y] ^= d[x]
+        c0 = a00 ^ a01 ^ a02 ^ a03 ^ a04
+        c1 = a10 ^ a11 ^ a12 ^ a13 ^ a14
+        c2 = a20 ^ a21 ^ a22 ^ a23 ^ a24
+        c3 = a30 ^ a31 ^ a32 ^ a33 ^ a34
+        c4 = a40 ^ a41 ^ a42 ^ a43 ^ a44
+        d0 = c4 ^ (((c1 << 1) | (c1 >> 63)) & mask)
+        d1 = c0 ^ (((c2 << 1) | (c2 >> 63)) & mask)
+        d2 = c1 ^ (((c3 << 1) | (c3 >> 63)) & mask)
+        d3 = c2 ^ (((c4 << 1) | (c4 >> 63)) & mask)
+        d4 = c3 ^ (((c0 << 1) | (c0 >> 63)) & mask)
+        a00 ^= d0
+        a10 ^= d1
+        a20 ^= d2
+        a30 ^= d3
+        a40 ^= d4
+        a01 ^= d0
+        a11 ^= d1
+        a21 ^= d2
+        a31 ^= d3
+        a41 ^= d4
+        a02 ^= d0
+        a12 ^= d1
+        a22 ^= d2
+        a32 ^= d3
+        a42 ^= d4
+        a03 ^= d0
+        a13 ^= d1
+        a23 ^= d2
+        a33 ^= d3
+        a43 ^= d4
+        a04 ^= d0
+        a14 ^= d1
+        a24 ^= d2
+        a34 ^= d3
+        a44 ^= d4
 
         # Rho & Pi
-        b = zero()
-        for x in rangew:
-            for y in rangeh:
-                b[y % w][(2 * x + 3 * y) % h] = rol(a[x][y], RotationConstants[y][x], lanew)
-
-        # Chi
-        for x in rangew:
-            for y in rangeh:
-                a[x][y] = b[x][y] ^ ((~b[(x + 1) % w][y]) & b[(x + 2) % w][y])
+        b00 = a00
+        b02 = ((a10 << 1) | (a10 >> 63)) & mask
+        b04 = ((a20 << 62) | (a20 >> 2)) & mask
+        b01 = ((a30 << 28) | (a30 >> 36)) & mask
+        b03 = ((a40 << 27) | (a40 >> 37)) & mask
+        b13 = ((a01 << 36) | (a01 >> 28)) & mask
+        b10 = ((a11 << 44) | (a11 >> 20)) & mask
+        b12 = ((a21 << 6) | (a21 >> 58)) & mask
+        b14 = ((a31 << 55) | (a31 >> 9)) & mask
+        b11 = ((a41 << 20) | (a41 >> 44)) & mask
+        b21 = ((a02 << 3) | (a02 >> 61)) & mask
+        b23 = ((a12 << 10) | (a12 >> 54)) & mask
+        b20 = ((a22 << 43) | (a22 >> 21)) & mask
+        b22 = ((a32 << 25) | (a32 >> 39)) & mask
+        b24 = ((a42 << 39) | (a42 >> 25)) & mask
+        b34 = ((a03 << 41) | (a03 >> 23)) & mask
+        b31 = ((a13 << 45) | (a13 >> 19)) & mask
+        b33 = ((a23 << 15) | (a23 >> 49)) & mask
+        b30 = ((a33 << 21) | (a33 >> 43)) & mask
+        b32 = ((a43 << 8) | (a43 >> 56)) & mask
+        b42 = ((a04 << 18) | (a04 >> 46)) & mask
+        b44 = ((a14 << 2) | (a14 >> 62)) & mask
+        b41 = ((a24 << 61) | (a24 >> 3)) & mask
+        b43 = ((a34 << 56) | (a34 >> 8)) & mask
+        b40 = ((a44 << 14) | (a44 >> 50)) & mask
+
+        # Chi: a ^ (~b & c), with ~b spelled b ^ mask. On uint64 backends this is
+        # the same all-ones NOT, so LLVM still emits andn (x86 BMI1) or bic
+        # (AArch64), and a SIMD port can do the whole expression with a single
+        # vpternlogq, immediate 0xD2 (operands in a, b, c order).
+        a00 = b00 ^ ((b10 ^ mask) & b20)
+        a10 = b10 ^ ((b20 ^ mask) & b30)
+        a20 = b20 ^ ((b30 ^ mask) & b40)
+        a30 = b30 ^ ((b40 ^ mask) & b00)
+        a40 = b40 ^ ((b00 ^ mask) & b10)
+        a01 = b01 ^ ((b11 ^ mask) & b21)
+        a11 = b11 ^ ((b21 ^ mask) & b31)
+        a21 = b21 ^ ((b31 ^ mask) & b41)
+        a31 = b31 ^ ((b41 ^ mask) & b01)
+        a41 = b41 ^ ((b01 ^ mask) & b11)
+        a02 = b02 ^ ((b12 ^ mask) & b22)
+        a12 = b12 ^ ((b22 ^ mask) & b32)
+        a22 = b22 ^ ((b32 ^ mask) & b42)
+        a32 = b32 ^ ((b42 ^ mask) & b02)
+        a42 = b42 ^ ((b02 ^ mask) & b12)
+        a03 = b03 ^ ((b13 ^ mask) & b23)
+        a13 = b13 ^ ((b23 ^ mask) & b33)
+        a23 = b23 ^ ((b33 ^ mask) & b43)
+        a33 = b33 ^ ((b43 ^ mask) & b03)
+        a43 = b43 ^ ((b03 ^ mask) & b13)
+        a04 = b04 ^ ((b14 ^ mask) & b24)
+        a14 = b14 ^ ((b24 ^ mask) & b34)
+        a24 = b24 ^ ((b34 ^ mask) & b44)
+        a34 = b34 ^ ((b44 ^ mask) & b04)
+        a44 = b44 ^ ((b04 ^ mask) & b14)
 
         # Iota
-        a[0][0] ^= rc
-
-    nr = 12 + 2 * int(log(state.lanew, 2))
-    for ir in range(nr):
-        keccak_round(state.s, RoundConstants[ir])
+        a00 ^= rc
+
+    s[0], s[1], s[2], s[3], s[4] = a00, a10, a20, a30, a40
+    s[5], s[6], s[7], s[8], s[9] = a01, a11, a21, a31, a41
+    s[10], s[11], s[12], s[13], s[14] = a02, a12, a22, a32, a42
+    s[15], s[16], s[17], s[18], s[19] = a03, a13, a23, a33, a43
+    s[20], s[21], s[22], s[23], s[24] = a04, a14, a24, a34, a44
+
+# Optional compiled permutation: with NumPy and Numba installed the same
+# Keccak-f[1600] runs as native uint64 code, otherwise keccak_f1600 is used.
+# Both are slow to import (Numba alone takes a few hundred milliseconds), so
+# they are only loaded once a backend or batch function needs them; np and
+# njit stay None until then, and for good when they are missing.
+np = None
+njit = None
+
+@lru_cache(maxsize=None)
+def load_numpy():
+    global np
+    try:
+        import numpy as np
+    except ImportError:
+        pass
+    return np
+
+@lru_cache(maxsize=None)
+def load_numba():
+    # The kernels are bound as module globals, so they compile (and hit
+    # Numba's on-disk cache) exactly as if they were defined at top level.
+    global njit, prange, RoundConstantsU64, NoBlockU64, keccak_f1600_nb
+    global keccak_f1600_jit, absorb_bytes_jit, keccak_f1600_columns_jit, keccak256_batch_jit
+    if load_numpy() is None:
+        return None
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    RoundConstantsU64 = np.array(RoundConstants, dtype=np.uint64)
+    NoBlockU64 = np.zeros(0, dtype=np.uint64)
+    keccak_f1600_nb = njit(cache=True)(keccak_f1600)
+
+    @njit(cache=True, boundscheck=False)
+    def keccak_f1600_jit(s, block):
+        # Absorb the block; once keccak_f1600_nb is inlined these stores feed
+        # round 0's theta directly instead of going back through memory.
+        for i in range(block.size):
+            s[i] ^= block[i]
+        keccak_f1600_nb(s, RoundConstantsU64)
+
+    @njit(cache=True)
+    def absorb_bytes_jit(s, data, pos, count):
+        # XOR count little-endian lanes starting at data[pos] into s.
+        for j in range(count):
+            lane = np.uint64(0)
+            for k in range(pos + 8 * j + 7, pos + 8 * j - 1, -1):
+                lane = (lane << 8) | np.uint64(data[k])
+            s[j] ^= lane
+
+    @njit(cache=True, parallel=True)
+    def keccak_f1600_columns_jit(states):
+        for j in prange(states.shape[1]):
+            keccak_f1600_nb(states[:, j], RoundConstantsU64)
+
+    @njit(cache=True, parallel=True)
+    def keccak256_batch_jit(data, offsets, out):
+        # Message i is data[offsets[i]:offsets[i + 1]]; its digest lanes go
+        # to out[i]. Each message runs its whole sponge on its own thread.
+        rate = 136
+        for i in prange(offsets.size - 1):
+            s = np.zeros(25, dtype=np.uint64)
+            pos = offsets[i]
+            end = offsets[i + 1]
+            while end - pos >= rate:
+                absorb_bytes_jit(s, data, pos, rate // 8)
+                keccak_f1600_nb(s, RoundConstantsU64)
+                pos += rate
+            last = np.zeros(rate, dtype=np.uint8)
+            last[: end - pos] = data[pos:end]
+            last[end - pos] ^= 0x01
+            last[rate - 1] ^= 0x80
+            absorb_bytes_jit(s, last, 0, rate // 8)
+            keccak_f1600_nb(s, RoundConstantsU64)
+            out[i, :] = s[:4]
+    return njit
+
+# Optional native permutation built from keccak_f1600.c (see the build line
+# there) and placed next to this file. It permutes the array('Q') lanes in
+# place through a ctypes view of the same buffer.
+@lru_cache(maxsize=None)
+def load_keccak_c():
+    suffix = {"win32": ".dll", "darwin": ".dylib"}.get(sys.platform, ".so")
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        lib = ctypes.CDLL(os.path.join(here, "libkeccak_f1600" + suffix))
+    except OSError:
+        return None
+    if not hasattr(lib, "keccak_f1600_isa"):
+        return None  # a build of an older keccak_f1600.c
+    lib.keccak_f1600_isa.argtypes = []
+    lib.keccak_f1600_isa.restype = ctypes.c_char_p
+    lib.keccak_f1600.argtypes = [ctypes.POINTER(ctypes.c_uint64)]
+    lib.keccak_f1600.restype = None
+    lib.keccak_f1600_columns.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    lib.keccak_f1600_columns.restype = None
+    return lib
+
+# Optional native permutation from an installed XKCP shared library. The
+# state goes through XKCP's own AddBytes/ExtractBytes because its optimized
+# builds keep some lanes complemented and want an aligned state buffer.
+@lru_cache(maxsize=None)
+def load_xkcp():
+    from ctypes.util import find_library
+    for name in ("XKCP", "keccak"):
+        path = find_library(name)
+        if path is None:
+            continue
+        try:
+            lib = ctypes.CDLL(path)
+        except OSError:
+            continue
+        if not hasattr(lib, "KeccakP1600_Permute_24rounds"):
+            continue
+        lib.KeccakP1600_Initialize.argtypes = [ctypes.c_void_p]
+        lib.KeccakP1600_AddBytes.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint]
+        lib.KeccakP1600_Permute_24rounds.argtypes = [ctypes.c_void_p]
+        lib.KeccakP1600_ExtractBytes.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint]
+        return lib
+    return None
+
+# Permutation hooks used by KeccakSponge, one per backend. When absorbing,
+# block is the rate-sized input block and is XORed in as part of the
+# permutation, which lets the JIT kernel fold it into round 0's theta.
+def keccak_f_python(state, block=None):
+    if block is not None:
+        state.absorb(block)
+    keccak_f1600(state.s)
+
+def keccak_f_numba(state, block=None):
+    # The JIT kernel takes the block as native uint64 lanes, which are only
+    # the little-endian lanes Keccak wants on little-endian hosts.
+    if block is not None and sys.byteorder != "little":
+        state.absorb(block)
+        block = None
+    lanes = NoBlockU64 if block is None else np.frombuffer(block, dtype=np.uint64)
+    keccak_f1600_jit(np.frombuffer(state.s, dtype=np.uint64), lanes)
+
+LaneArray = ctypes.c_uint64 * 25
+
+def keccak_f_c(state, block=None):
+    if block is not None:
+        state.absorb(block)
+    keccak_c.keccak_f1600(LaneArray.from_buffer(state.s))
+
+def keccak_f_xkcp(state, block=None):
+    if block is not None:
+        state.absorb(block)
+    raw = (ctypes.c_uint8 * 264)()
+    st = (ctypes.addressof(raw) + 63) & ~63
+    out = ctypes.create_string_buffer(200)
+    xkcp.KeccakP1600_Initialize(st)
+    xkcp.KeccakP1600_AddBytes(st, state.get_bytes(), 0, 200)
+    xkcp.KeccakP1600_Permute_24rounds(st)
+    xkcp.KeccakP1600_ExtractBytes(st, out, 0, 200)
+    state.set_bytes(out.raw)
+
+# Optional native Keccak-256 from pysha3 (or its safe-pysha3 fork), whose
+# hashlib-style objects support update/digest/copy. KeccakHash hands all of
+# its work to it when KECCAK_BACKEND is "auto"; naming a permutation backend
+# keeps hashing on the sponge below.
+def load_pysha3():
+    try:
+        from sha3 import keccak_256
+    except ImportError:
+        return None
+    return keccak_256
+
+# Optional native Keccak-256 from pycryptodome. Its hash objects can be
+# neither copied nor updated after digest, so it only backs the one-shot
+# keccak256(), and only when pysha3 is missing.
+def load_pycryptodome():
+    try:
+        from Crypto.Hash import keccak
+    except ImportError:
+        return None
+    return keccak
+
+# KECCAK_BACKEND picks the permutation: "auto" (the default) takes the
+# first available one in the order below, any other name forces that one.
+# Each backend's loader runs only when it is tried, so "auto" stops loading
+# at the first one found.
+backend = os.environ.get("KECCAK_BACKEND", "auto")
+pysha3_keccak = load_pysha3() if backend == "auto" else None
+crypto_keccak = load_pycryptodome() if backend == "auto" and pysha3_keccak is None else None
+Backends = {
+    "c": (keccak_f_c, load_keccak_c),
+    "xkcp": (keccak_f_xkcp, load_xkcp),
+    "numba": (keccak_f_numba, load_numba),
+    "python": (keccak_f_python, lambda: True),
+}
+if backend == "auto":
+    backend = next(name for name, (_, load) in Backends.items() if load() is not None)
+elif backend not in Backends:
+    raise ImportError("unknown KECCAK_BACKEND %r" % backend)
+elif Backends[backend][1]() is None:
+    raise ImportError("KECCAK_BACKEND=%s is not available here" % backend)
+
+keccak_f = Backends[backend][0]
+keccak_c = load_keccak_c() if backend == "c" else None
+xkcp = load_xkcp() if backend == "xkcp" else None
+
+# The library picks its own code path for the running CPU, once; this names
+# it ("avx512f", "scalar", "interleaved32") when the c backend is in use.
+keccak_c_isa = keccak_c.keccak_f1600_isa().decode() if backend == "c" else None
+
+# Keccak-f[1600] applied in place to every column of a (25, N) uint64 NumPy
+# array, i.e. N independent states with lane i of each in row i. The C
+# backend permutes 8 adjacent columns per SIMD register (AVX2 or AVX-512,
+# picked for the running CPU); under Numba the columns are permuted in
+# parallel; otherwise keccak_f1600 runs on the rows, one ufunc per lane
+# operation across all N states. The C kernel needs native uint64 lanes in
+# C order, so other layouts are permuted on a contiguous copy.
+def keccak_f_batch(states):
+    load_numpy()
+    if (
+        states.ndim != 2 or states.shape[0] != 25 or states.dtype != np.uint64
+        or not states.flags.writeable
+    ):
+        raise ValueError("keccak_f_batch needs a writeable (25, N) uint64 array")
+    if backend == "c":
+        work = np.ascontiguousarray(states)
+        keccak_c.keccak_f1600_columns(work.ctypes.data, work.shape[1])
+        if work is not states:
+            states[...] = work
+    elif backend != "python" and load_numba() is not None:
+        keccak_f1600_columns_jit(states)
+    else:
+        keccak_f1600(states)
 
 # --------------------------------------------------------------------
 #                          Keccak State & Sponge
 # --------------------------------------------------------------------
 
 class KeccakState:
+    __slots__ = ("bitrate", "b", "bitrate_bytes", "lanew", "rate_format", "state_format", "s")
+
     W = 5
     H = 5
     rangeW = range(W)
     rangeH = range(H)
 
-    @staticmethod
-    def zero():
-        return [[0] * KeccakState.W for _ in KeccakState.rangeH]
+    # Lanes are stored unboxed as native uint64 in an array.array. Buffer
+    # views of it (NumPy, ctypes) therefore see the lanes without copying.
+    # New states are copied from Zero, which is cheaper than building one.
+    Zero = array("Q", bytes(8 * W * H))
 
     @staticmethod
-    def lane2bytes(s, w):
-        out = []
-        for b in range(0, w, 8):
-            out.append((s >> b) & 0xFF)
-        return out
-
-    @staticmethod
-    def bytes2lane(bb):
-        r = 0
-        for b in reversed(bb):
-            r = (r << 8) | b
-        return r
-
-    @staticmethod
-    def ilist2bytes(bb):
-        return bytes(bb)
+    def zero():
+        return KeccakState.Zero[:]
 
     def __init__(self, bitrate, b):
         self.bitrate = bitrate
@@ -124,116 +450,274 @@ class KeccakState:
         assert self.bitrate % 8 == 0
         self.bitrate_bytes = bits2bytes(self.bitrate)
         self.lanew = self.b // 25
+        self.rate_format = "<%dQ" % (self.bitrate_bytes // 8)
+        self.state_format = "<25Q"
         self.s = KeccakState.zero()
 
+    def clone(self):
+        other = KeccakState.__new__(KeccakState)
+        other.bitrate = self.bitrate
+        other.b = self.b
+        other.bitrate_bytes = self.bitrate_bytes
+        other.lanew = self.lanew
+        other.rate_format = self.rate_format
+        other.state_format = self.state_format
+        other.s = self.s[:]
+        return other
+
     def absorb(self, block):
+        # block is any bytes-like object covering exactly the rate.
         assert len(block) == self.bitrate_bytes
-        block += [0] * bits2bytes(self.b - self.bitrate)
-        i = 0
-        for y in self.rangeH:
-            for x in self.rangeW:
-                lane_bytes = block[i : i + 8]
-                self.s[x][y] ^= KeccakState.bytes2lane(lane_bytes)
-                i += 8
+        lanes = unpack_from(self.rate_format, block)
+        self.s[: len(lanes)] = array("Q", map(xor, self.s, lanes))
 
     def squeeze(self):
         full = self.get_bytes()
         return full[: self.bitrate_bytes]
 
     def get_bytes(self):
-        out = [0] * bits2bytes(self.b)
-        i = 0
-        for y in self.rangeH:
-            for x in self.rangeW:
-                v = KeccakState.lane2bytes(self.s[x][y], self.lanew)
-                out[i : i + 8] = v
-                i += 8
-        return out
+        if sys.byteorder == "little":
+            return self.s.tobytes()
+        return pack(self.state_format, *self.s)
 
     def set_bytes(self, bb):
-        i = 0
-        for y in self.rangeH:
-            for x in self.rangeW:
-                self.s[x][y] = KeccakState.bytes2lane(bb[i : i + 8])
-                i += 8
+        self.s[:] = array("Q", unpack(self.state_format, bb))
+
+    def reset(self):
+        self.s[:] = KeccakState.Zero
 
 class KeccakSponge:
+    __slots__ = ("state", "padfn", "permfn", "buffer", "squeeze_pending")
+
     def __init__(self, bitrate, width, padfn, permfn):
         self.state = KeccakState(bitrate, width)
         self.padfn = padfn
         self.permfn = permfn
-        self.buffer = []
+        self.buffer = bytearray()
+        self.squeeze_pending = False
 
     def copy(self):
-        return deepcopy(self)
+        other = KeccakSponge.__new__(KeccakSponge)
+        other.state = self.state.clone()
+        other.padfn = self.padfn
+        other.permfn = self.permfn
+        other.buffer = self.buffer[:]
+        other.squeeze_pending = self.squeeze_pending
+        return other
+
+    def reset(self):
+        self.state.reset()
+        self.buffer.clear()
+        self.squeeze_pending = False
 
     def absorb_block(self, block_bytes):
         assert len(block_bytes) == self.state.bitrate_bytes
-        self.state.absorb(block_bytes)
-        self.permfn(self.state)
+        self.permfn(self.state, block_bytes)
 
     def absorb(self, data_bytes):
-        self.buffer += data_bytes
-        while len(self.buffer) >= self.state.bitrate_bytes:
-            self.absorb_block(self.buffer[: self.state.bitrate_bytes])
-            self.buffer = self.buffer[self.state.bitrate_bytes :]
+        # Whole blocks are absorbed straight from the caller's data; only a
+        # partial block at either end is copied into self.buffer.
+        rb = self.state.bitrate_bytes
+        with memoryview(data_bytes) as view, view.cast("B") as data:
+            pos = 0
+            if self.buffer:
+                pos = min(rb - len(self.buffer), len(data))
+                self.buffer += data[:pos]
+                if len(self.buffer) < rb:
+                    return
+                self.absorb_block(self.buffer)
+                self.buffer.clear()
+            while pos + rb <= len(data):
+                self.absorb_block(data[pos : pos + rb])
+                pos += rb
+            self.buffer += data[pos:]
 
     def absorb_final(self):
-        padded = self.buffer + self.padfn(len(self.buffer), self.state.bitrate_bytes)
-        self.absorb_block(padded)
-        self.buffer = []
+        self.buffer += self.padfn(len(self.buffer), self.state.bitrate_bytes)
+        self.absorb_block(self.buffer)
+        self.buffer.clear()
 
     def squeeze_once(self):
-        out_block = self.state.squeeze()
-        self.permfn(self.state)
-        return out_block
+        # The permutation between output blocks is deferred until the next
+        # block is asked for, so an output that fits in one block (every
+        # keccak256 digest) costs no permutation beyond absorb_final's.
+        if self.squeeze_pending:
+            self.permfn(self.state)
+        self.squeeze_pending = True
+        return self.state.squeeze()
 
     def squeeze(self, length):
-        out = []
+        if length <= self.state.bitrate_bytes:
+            return self.squeeze_once()[:length]
+        out = bytearray()
         while len(out) < length:
             out += self.squeeze_once()
-        return out[:length]
+        del out[length:]
+        return bytes(out)
 
 # --------------------------------------------------------------------
 #                          Keccak-256 Class
 # --------------------------------------------------------------------
 
 class KeccakHash:
+    __slots__ = ("native", "sponge")
+
+    # For Keccak256: rate=1088, capacity=512 => total 1600 bits
+    # Output length = 256 bits
+    # Fixed for every instance, so set once here rather than per __init__.
+    output_bits = 256
+    bitrate_bits = 1088
+    capacity_bits = 512
+    digest_size = bits2bytes(output_bits)
+    block_size = bits2bytes(bitrate_bits)
+
     def __init__(self):
-        # For Keccak256: rate=1088, capacity=512 => total 1600 bits
-        # Output length = 256 bits
-        self.output_bits = 256
-        bitrate_bits = 1088
-        capacity_bits = 512
-        self.sponge = KeccakSponge(
-            bitrate_bits,
-            bitrate_bits + capacity_bits,
-            multirate_padding,
-            keccak_f,
-        )
-        self.digest_size = bits2bytes(self.output_bits)
-        self.block_size = bits2bytes(bitrate_bits)
+        # With pysha3 available the native hash does everything and no
+        # sponge is built.
+        self.native = None if pysha3_keccak is None else pysha3_keccak()
+        self.sponge = None
+        if self.native is None:
+            self.sponge = KeccakSponge(
+                self.bitrate_bits,
+                self.bitrate_bits + self.capacity_bits,
+                multirate_padding,
+                keccak_f,
+            )
+
+    def copy(self) -> "KeccakHash":
+        other = KeccakHash.__new__(KeccakHash)
+        other.native = None if self.native is None else self.native.copy()
+        other.sponge = None if self.sponge is None else self.sponge.copy()
+        return other
 
     def update(self, data: bytes):
-        self.sponge.absorb(list(data))
+        if self.native is not None:
+            self.native.update(data)
+        else:
+            self.sponge.absorb(data)
 
     def digest(self) -> bytes:
+        if self.native is not None:
+            return self.native.digest()
         final = self.sponge.copy()
         final.absorb_final()
-        out_bytes = final.squeeze(self.digest_size)
-        return KeccakState.ilist2bytes(out_bytes)
+        return final.squeeze(self.digest_size)
 
     def hexdigest(self) -> str:
         return self.digest().hex()
 
+# A Keccak-256 sponge that never absorbs anything: the one-shot functions
+# clone their starting state or sponge from it. It is built here rather
+# than taken from a KeccakHash, which has no sponge when pysha3 is used.
+FreshSponge = KeccakSponge(
+    KeccakHash.bitrate_bits,
+    KeccakHash.bitrate_bits + KeccakHash.capacity_bits,
+    multirate_padding,
+    keccak_f,
+)
+
+# Short inputs such as function signatures and event topics get hashed over
+# and over, so digests of bytes inputs up to this length are memoized.
+SmallInputLimit = 64
+
+def keccak256_short(data: bytes) -> bytes:
+    # keccak256 of less than one rate block of bytes: padded, the message is
+    # a single block, so it is absorbed straight into a fresh state with one
+    # permutation and no sponge buffer, copy or squeeze loop.
+    block = bytearray(data)
+    block += multirate_padding(len(block), KeccakHash.block_size)
+    state = FreshSponge.state.clone()
+    keccak_f(state, block)
+    return state.get_bytes()[: KeccakHash.digest_size]
+
+# One scratch sponge per thread for keccak256(). It is reset instead of
+# rebuilt for every message, and finalized in place because nothing else
+# ever sees it, which also saves digest()'s defensive copy.
+Scratch = threading.local()
+
+def scratch_sponge():
+    sponge = getattr(Scratch, "sponge", None)
+    if sponge is None:
+        sponge = Scratch.sponge = FreshSponge.copy()
+    else:
+        sponge.reset()
+    return sponge
+
+@lru_cache(maxsize=4096)
+def keccak256_small(data: bytes) -> bytes:
+    return keccak256_short(data)
+
 def keccak256(data: bytes) -> bytes:
-    h = KeccakHash()
-    h.update(data)
-    return h.digest()
+    if pysha3_keccak is not None:
+        return pysha3_keccak(data).digest()
+    if crypto_keccak is not None:
+        return crypto_keccak.new(data=data, digest_bits=256).digest()
+    if type(data) is bytes and len(data) <= SmallInputLimit:
+        return keccak256_small(data)
+    if type(data) in (bytes, bytearray) and len(data) < KeccakHash.block_size:
+        return keccak256_short(data)
+    sponge = scratch_sponge()
+    sponge.absorb(data)
+    sponge.absorb_final()
+    return sponge.squeeze(KeccakHash.digest_size)
 
 def keccak256_hex(data: bytes) -> str:
     return keccak256(data).hex()
 
+# Groups smaller than this are hashed one by one: on a NumPy (25, N) state
+# every lane operation is a ufunc call, which only pays off across many lanes.
+BatchMinimum = 16
+
+def keccak256_batch(messages):
+    # keccak256 of equally-padded messages (same number of rate blocks), all
+    # permuted together on a (25, N) uint64 state where lane i of every
+    # message is row i.
+    rate = bits2bytes(1088)
+    padded = b"".join(m + multirate_padding(len(m) % rate, rate) for m in messages)
+    lanes = np.frombuffer(padded, dtype="<u8").reshape(len(messages), -1, rate // 8)
+    s = np.zeros((25, len(messages)), dtype=np.uint64)
+    for k in range(lanes.shape[1]):
+        s[: rate // 8] ^= lanes[:, k, :].T
+        keccak_f_batch(s)
+    out = s[:4].T.astype("<u8").tobytes()
+    return [out[i : i + 32] for i in range(0, len(out), 32)]
+
+def keccak256_many(messages) -> list:
+    # keccak256 of every message in order. On the C backend, messages that
+    # pad to the same number of blocks are permuted 8 at a time by its SIMD
+    # column kernel, which beats even a native hash per message; short of
+    # that a native one-shot hash (pysha3, pycryptodome) wins. With Numba
+    # the messages are hashed in parallel by keccak256_batch_jit, and with
+    # NumPy only they are batched like on the C backend.
+    if backend != "c" and (pysha3_keccak is not None or crypto_keccak is not None):
+        return [keccak256(m) for m in messages]
+    # Lengths below are byte counts, so every message becomes bytes here:
+    # this also takes any iterable and any buffer, whatever its item size.
+    messages = [m if type(m) is bytes else bytes(memoryview(m)) for m in messages]
+    if backend not in ("python", "c") and load_numba() is not None:
+        offsets = np.zeros(len(messages) + 1, dtype=np.int64)
+        np.cumsum([len(m) for m in messages], out=offsets[1:])
+        data = np.frombuffer(b"".join(messages), dtype=np.uint8)
+        lanes = np.empty((len(messages), 4), dtype=np.uint64)
+        keccak256_batch_jit(data, offsets, lanes)
+        out = lanes.astype("<u8").tobytes()
+        return [out[i : i + 32] for i in range(0, len(out), 32)]
+    if load_numpy() is None:
+        return [keccak256(m) for m in messages]
+    rate = bits2bytes(1088)
+    out = [None] * len(messages)
+    groups = {}
+    for i, m in enumerate(messages):
+        groups.setdefault(len(m) // rate, []).append(i)
+    for idx in groups.values():
+        if len(idx) < BatchMinimum:
+            for i in idx:
+                out[i] = keccak256(messages[i])
+            continue
+        for i, digest in zip(idx, keccak256_batch([messages[i] for i in idx])):
+            out[i] = digest
+    return out
+
 # --------------------------------------------------------------------
 #                                Main
 # --------------------------------------------------------------------
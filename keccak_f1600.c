@@ -0,0 +1,507 @@
+/*
+ * Keccak-f[1600] permutation for keccak256.py's "c" backend.
+ *
+ * The state is the flat 25-lane layout used by keccak256.py: lane (x, y) is
+ * s[x + 5*y], each lane a native uint64_t. keccak256.py finds the library next
+ * to itself and calls it through ctypes on its array('Q') state in place, so
+ * nothing has to be installed or registered with Python.
+ *
+ * Build:
+ *   cc -O3 -shared -fPIC -o libkeccak_f1600.so keccak_f1600.c
+ *
+ * On 32-bit targets the permutation runs on a bit-interleaved form of the
+ * state instead (pass -DKECCAK_BIT_INTERLEAVE=0 or =1 to override). x86-64
+ * builds with GCC or clang also carry an AVX-512 version, used when the CPU
+ * supports it.
+ */
+
+#include <stdint.h>
+
+#ifndef KECCAK_BIT_INTERLEAVE
+#if UINTPTR_MAX <= 0xFFFFFFFFu
+#define KECCAK_BIT_INTERLEAVE 1
+#else
+#define KECCAK_BIT_INTERLEAVE 0
+#endif
+#endif
+
+static const uint64_t round_constants[24] = {
+    0x0000000000000001ULL, 0x0000000000008082ULL, 0x800000000000808AULL, 0x8000000080008000ULL,
+    0x000000000000808BULL, 0x0000000080000001ULL, 0x8000000080008081ULL, 0x8000000000008009ULL,
+    0x000000000000008AULL, 0x0000000000000088ULL, 0x0000000080008009ULL, 0x000000008000000AULL,
+    0x000000008000808BULL, 0x800000000000008BULL, 0x8000000000008089ULL, 0x8000000000008003ULL,
+    0x8000000000008002ULL, 0x8000000000000080ULL, 0x000000000000800AULL, 0x800000008000000AULL,
+    0x8000000080008081ULL, 0x8000000000008080ULL, 0x0000000080000001ULL, 0x8000000080008008ULL,
+};
+
+/*
+ * Rho & Pi as a single chain. Pi is one 24-cycle over the lanes, starting
+ * at lane 1 (lane 0 stays put and is not rotated). Following the cycle lets
+ * each lane be rotated straight into its destination, holding just one lane
+ * in a temporary instead of a 25-lane scratch copy of the state. Step i
+ * moves the carried lane into chain_lanes[i], rotated by chain_rotations[i].
+ */
+static const unsigned chain_lanes[24] = {
+    10,  7, 11, 17, 18,  3,  5, 16,  8, 21, 24,  4,
+    15, 23, 19, 13, 12,  2, 20, 14, 22,  9,  6,  1,
+};
+
+static const unsigned chain_rotations[24] = {
+     1,  3,  6, 10, 15, 21, 28, 36, 45, 55,  2, 14,
+    27, 41, 56,  8, 25, 43, 62, 18, 39, 61, 20, 44,
+};
+
+#if !KECCAK_BIT_INTERLEAVE
+
+/*
+ * All 25 lanes live in locals for the whole permutation and every lane index
+ * and rotation offset in the round body is a constant, so the compiler keeps
+ * the state in registers and emits one rotate instruction per ROL64. (Fully
+ * unrolling the 24 rounds on top of that measured no faster.)
+ */
+#if defined(_MSC_VER)
+#include <stdlib.h>
+#define ROL64(v, n) _rotl64(v, n)
+#elif defined(__has_builtin)
+#if __has_builtin(__builtin_rotateleft64)
+#define ROL64(v, n) __builtin_rotateleft64(v, n)
+#endif
+#endif
+#ifndef ROL64
+/* n is always 1..63 here, so both shifts are well defined. */
+#define ROL64(v, n) (((v) << (n)) | ((v) >> (64 - (n))))
+#endif
+
+static void keccak_f1600_scalar(uint64_t s[25])
+{
+    uint64_t a00 = s[0], a10 = s[1], a20 = s[2], a30 = s[3], a40 = s[4];
+    uint64_t a01 = s[5], a11 = s[6], a21 = s[7], a31 = s[8], a41 = s[9];
+    uint64_t a02 = s[10], a12 = s[11], a22 = s[12], a32 = s[13], a42 = s[14];
+    uint64_t a03 = s[15], a13 = s[16], a23 = s[17], a33 = s[18], a43 = s[19];
+    uint64_t a04 = s[20], a14 = s[21], a24 = s[22], a34 = s[23], a44 = s[24];
+    uint64_t b00, b10, b20, b30, b40;
+    uint64_t b01, b11, b21, b31, b41;
+    uint64_t b02, b12, b22, b32, b42;
+    uint64_t b03, b13, b23, b33, b43;
+    uint64_t b04, b14, b24, b34, b44;
+    uint64_t c0, c1, c2, c3, c4, d0, d1, d2, d3, d4;
+    int round;
+
+    for (round = 0; round < 24; round++) {
+        /* Theta */
+        c0 = a00 ^ a01 ^ a02 ^ a03 ^ a04;
+        c1 = a10 ^ a11 ^ a12 ^ a13 ^ a14;
+        c2 = a20 ^ a21 ^ a22 ^ a23 ^ a24;
+        c3 = a30 ^ a31 ^ a32 ^ a33 ^ a34;
+        c4 = a40 ^ a41 ^ a42 ^ a43 ^ a44;
+        d0 = c4 ^ ROL64(c1, 1);
+        d1 = c0 ^ ROL64(c2, 1);
+        d2 = c1 ^ ROL64(c3, 1);
+        d3 = c2 ^ ROL64(c4, 1);
+        d4 = c3 ^ ROL64(c0, 1);
+        a00 ^= d0; a10 ^= d1; a20 ^= d2; a30 ^= d3; a40 ^= d4;
+        a01 ^= d0; a11 ^= d1; a21 ^= d2; a31 ^= d3; a41 ^= d4;
+        a02 ^= d0; a12 ^= d1; a22 ^= d2; a32 ^= d3; a42 ^= d4;
+        a03 ^= d0; a13 ^= d1; a23 ^= d2; a33 ^= d3; a43 ^= d4;
+        a04 ^= d0; a14 ^= d1; a24 ^= d2; a34 ^= d3; a44 ^= d4;
+
+        /* Rho & Pi */
+        b00 = a00;
+        b02 = ROL64(a10, 1);
+        b04 = ROL64(a20, 62);
+        b01 = ROL64(a30, 28);
+        b03 = ROL64(a40, 27);
+        b13 = ROL64(a01, 36);
+        b10 = ROL64(a11, 44);
+        b12 = ROL64(a21, 6);
+        b14 = ROL64(a31, 55);
+        b11 = ROL64(a41, 20);
+        b21 = ROL64(a02, 3);
+        b23 = ROL64(a12, 10);
+        b20 = ROL64(a22, 43);
+        b22 = ROL64(a32, 25);
+        b24 = ROL64(a42, 39);
+        b34 = ROL64(a03, 41);
+        b31 = ROL64(a13, 45);
+        b33 = ROL64(a23, 15);
+        b30 = ROL64(a33, 21);
+        b32 = ROL64(a43, 8);
+        b42 = ROL64(a04, 18);
+        b44 = ROL64(a14, 2);
+        b41 = ROL64(a24, 61);
+        b43 = ROL64(a34, 56);
+        b40 = ROL64(a44, 14);
+
+        /* Chi */
+        a00 = b00 ^ (~b10 & b20);
+        a10 = b10 ^ (~b20 & b30);
+        a20 = b20 ^ (~b30 & b40);
+        a30 = b30 ^ (~b40 & b00);
+        a40 = b40 ^ (~b00 & b10);
+        a01 = b01 ^ (~b11 & b21);
+        a11 = b11 ^ (~b21 & b31);
+        a21 = b21 ^ (~b31 & b41);
+        a31 = b31 ^ (~b41 & b01);
+        a41 = b41 ^ (~b01 & b11);
+        a02 = b02 ^ (~b12 & b22);
+        a12 = b12 ^ (~b22 & b32);
+        a22 = b22 ^ (~b32 & b42);
+        a32 = b32 ^ (~b42 & b02);
+        a42 = b42 ^ (~b02 & b12);
+        a03 = b03 ^ (~b13 & b23);
+        a13 = b13 ^ (~b23 & b33);
+        a23 = b23 ^ (~b33 & b43);
+        a33 = b33 ^ (~b43 & b03);
+        a43 = b43 ^ (~b03 & b13);
+        a04 = b04 ^ (~b14 & b24);
+        a14 = b14 ^ (~b24 & b34);
+        a24 = b24 ^ (~b34 & b44);
+        a34 = b34 ^ (~b44 & b04);
+        a44 = b44 ^ (~b04 & b14);
+
+        /* Iota */
+        a00 ^= round_constants[round];
+    }
+
+    s[0] = a00; s[1] = a10; s[2] = a20; s[3] = a30; s[4] = a40;
+    s[5] = a01; s[6] = a11; s[7] = a21; s[8] = a31; s[9] = a41;
+    s[10] = a02; s[11] = a12; s[12] = a22; s[13] = a32; s[14] = a42;
+    s[15] = a03; s[16] = a13; s[17] = a23; s[18] = a33; s[19] = a43;
+    s[20] = a04; s[21] = a14; s[22] = a24; s[23] = a34; s[24] = a44;
+}
+
+#if defined(__GNUC__) && defined(__x86_64__)
+#define KECCAK_AVX512 1
+#include <immintrin.h>
+
+/*
+ * AVX-512 permutation of a single state. Row y (lanes x = 0..4) lives in
+ * the low five elements of one zmm register; the top three elements are
+ * don't-care and never feed back into the low five. Theta's three-way XORs
+ * and chi's a ^ (~b & c) are one vpternlogq each (0x96 and 0xD2), rho is one
+ * vprolvq per row, and the lane moves of theta, pi and chi are vpermq /
+ * vpermt2q shuffles.
+ */
+static const uint64_t lane_next1[8] = { 1, 2, 3, 4, 0, 5, 6, 7 };
+static const uint64_t lane_next2[8] = { 2, 3, 4, 0, 1, 5, 6, 7 };
+static const uint64_t lane_prev1[8] = { 4, 0, 1, 2, 3, 5, 6, 7 };
+
+static const uint64_t row_rho[5][8] = {
+    {  0,  1, 62, 28, 27, 0, 0, 0 },
+    { 36, 44,  6, 55, 20, 0, 0, 0 },
+    {  3, 10, 43, 25, 39, 0, 0, 0 },
+    { 41, 45, 15, 21,  8, 0, 0, 0 },
+    { 18,  2, 61, 56, 14, 0, 0, 0 },
+};
+
+/*
+ * Pi sends lane (x, y) to (y, 2x + 3y), so element X of new row Y is element
+ * (X + 3Y) % 5 of old row X. Row Y is gathered with one index vector: lanes
+ * 0-1 from old rows 0 and 1 (vpermt2q, +8 selects the second source), lanes
+ * 2-3 the same way from rows 2 and 3, and lane 4 from row 4.
+ */
+static const uint64_t row_pi[5][8] = {
+    { 0,  9, 2, 11, 4, 0, 0, 0 },
+    { 3, 12, 0,  9, 2, 0, 0, 0 },
+    { 1, 10, 3, 12, 0, 0, 0, 0 },
+    { 4,  8, 1, 10, 3, 0, 0, 0 },
+    { 2, 11, 4,  8, 1, 0, 0, 0 },
+};
+
+__attribute__((target("avx512f")))
+static void keccak_f1600_avx512(uint64_t s[25])
+{
+    const __m512i next1 = _mm512_loadu_si512(lane_next1);
+    const __m512i next2 = _mm512_loadu_si512(lane_next2);
+    const __m512i prev1 = _mm512_loadu_si512(lane_prev1);
+    __m512i a[5], b[5], c, cm, cp, lo, mid;
+    int round, y;
+
+    for (y = 0; y < 5; y++)
+        a[y] = _mm512_maskz_loadu_epi64(0x1F, s + 5 * y);
+
+    for (round = 0; round < 24; round++) {
+        /* Theta */
+        c = _mm512_ternarylogic_epi64(a[0], a[1], a[2], 0x96);
+        c = _mm512_ternarylogic_epi64(c, a[3], a[4], 0x96);
+        cm = _mm512_permutexvar_epi64(prev1, c);
+        cp = _mm512_rol_epi64(_mm512_permutexvar_epi64(next1, c), 1);
+        for (y = 0; y < 5; y++)
+            a[y] = _mm512_ternarylogic_epi64(a[y], cm, cp, 0x96);
+
+        /* Rho */
+        for (y = 0; y < 5; y++)
+            a[y] = _mm512_rolv_epi64(a[y], _mm512_loadu_si512(row_rho[y]));
+
+        /* Pi */
+        for (y = 0; y < 5; y++) {
+            const __m512i idx = _mm512_loadu_si512(row_pi[y]);
+            lo = _mm512_permutex2var_epi64(a[0], idx, a[1]);
+            mid = _mm512_permutex2var_epi64(a[2], idx, a[3]);
+            lo = _mm512_mask_blend_epi64(0x0C, lo, mid);
+            b[y] = _mm512_mask_permutexvar_epi64(lo, 0x10, idx, a[4]);
+        }
+
+        /* Chi */
+        for (y = 0; y < 5; y++)
+            a[y] = _mm512_ternarylogic_epi64(b[y], _mm512_permutexvar_epi64(next1, b[y]),
+                                             _mm512_permutexvar_epi64(next2, b[y]), 0xD2);
+
+        /* Iota */
+        a[0] = _mm512_mask_xor_epi64(a[0], 0x01, a[0], _mm512_set1_epi64((long long)round_constants[round]));
+    }
+
+    for (y = 0; y < 5; y++)
+        _mm512_mask_storeu_epi64(s + 5 * y, 0x1F, a[y]);
+}
+#endif
+
+/* The implementation is picked on the first call, from the running CPU. */
+static void keccak_f1600_resolve(uint64_t s[25]);
+static void (*keccak_f1600_impl)(uint64_t s[25]) = keccak_f1600_resolve;
+
+static void keccak_f1600_resolve(uint64_t s[25])
+{
+    keccak_f1600_impl = keccak_f1600_scalar;
+#ifdef KECCAK_AVX512
+    if (__builtin_cpu_supports("avx512f"))
+        keccak_f1600_impl = keccak_f1600_avx512;
+#endif
+    keccak_f1600_impl(s);
+}
+
+void keccak_f1600(uint64_t s[25])
+{
+    keccak_f1600_impl(s);
+}
+
+#else
+
+/*
+ * Bit interleaving: each lane is kept as two 32-bit words, one holding its
+ * even bits and one its odd bits. Theta, chi and iota work on the halves
+ * independently, and a 64-bit rotate by r becomes two 32-bit rotates: by r/2
+ * each when r is even, or with the halves swapped and rotated by (r+1)/2 and
+ * r/2 when r is odd. That avoids the multi-instruction 64-bit rotate a 32-bit
+ * CPU would otherwise need for every lane.
+ */
+
+static inline uint32_t rol32(uint32_t v, unsigned n)
+{
+    return (v << n) | (v >> ((32 - n) & 31));
+}
+
+/* Gather the even bits of v into a 32-bit word. */
+static uint32_t even_bits(uint64_t v)
+{
+    v &= 0x5555555555555555ULL;
+    v = (v | (v >> 1)) & 0x3333333333333333ULL;
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0FULL;
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FFULL;
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFFULL;
+    v = (v | (v >> 16)) & 0x00000000FFFFFFFFULL;
+    return (uint32_t)v;
+}
+
+/* Inverse of even_bits: spread w over the even bits of a 64-bit word. */
+static uint64_t spread_bits(uint32_t w)
+{
+    uint64_t v = w;
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFFULL;
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FFULL;
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0FULL;
+    v = (v | (v << 2)) & 0x3333333333333333ULL;
+    v = (v | (v << 1)) & 0x5555555555555555ULL;
+    return v;
+}
+
+void keccak_f1600(uint64_t s[25])
+{
+    uint32_t e[25], o[25], ce[5], co[5], de, dodd, te, to, ue, uo;
+    unsigned r;
+    int round, x, y, i, j;
+
+    for (i = 0; i < 25; i++) {
+        e[i] = even_bits(s[i]);
+        o[i] = even_bits(s[i] >> 1);
+    }
+
+    for (round = 0; round < 24; round++) {
+        /* Theta */
+        for (x = 0; x < 5; x++) {
+            ce[x] = e[x] ^ e[x + 5] ^ e[x + 10] ^ e[x + 15] ^ e[x + 20];
+            co[x] = o[x] ^ o[x + 5] ^ o[x + 10] ^ o[x + 15] ^ o[x + 20];
+        }
+        for (x = 0; x < 5; x++) {
+            de = ce[(x + 4) % 5] ^ rol32(co[(x + 1) % 5], 1);
+            dodd = co[(x + 4) % 5] ^ ce[(x + 1) % 5];
+            for (y = 0; y < 25; y += 5) {
+                e[y + x] ^= de;
+                o[y + x] ^= dodd;
+            }
+        }
+
+        /* Rho & Pi */
+        te = e[1];
+        to = o[1];
+        for (i = 0; i < 24; i++) {
+            r = chain_rotations[i];
+            j = chain_lanes[i];
+            ue = e[j];
+            uo = o[j];
+            if (r & 1) {
+                e[j] = rol32(to, (r + 1) / 2);
+                o[j] = rol32(te, r / 2);
+            } else {
+                e[j] = rol32(te, r / 2);
+                o[j] = rol32(to, r / 2);
+            }
+            te = ue;
+            to = uo;
+        }
+
+        /* Chi */
+        for (y = 0; y < 25; y += 5) {
+            for (x = 0; x < 5; x++) {
+                ce[x] = e[y + x];
+                co[x] = o[y + x];
+            }
+            for (x = 0; x < 5; x++) {
+                e[y + x] = ce[x] ^ (~ce[(x + 1) % 5] & ce[(x + 2) % 5]);
+                o[y + x] = co[x] ^ (~co[(x + 1) % 5] & co[(x + 2) % 5]);
+            }
+        }
+
+        /* Iota */
+        e[0] ^= even_bits(round_constants[round]);
+        o[0] ^= even_bits(round_constants[round] >> 1);
+    }
+
+    for (i = 0; i < 25; i++)
+        s[i] = spread_bits(e[i]) | (spread_bits(o[i]) << 1);
+}
+
+#endif
+
+/* Which keccak_f1600 implementation this CPU runs, for diagnostics. */
+const char *keccak_f1600_isa(void)
+{
+#ifdef KECCAK_AVX512
+    if (__builtin_cpu_supports("avx512f"))
+        return "avx512f";
+#endif
+    return KECCAK_BIT_INTERLEAVE ? "interleaved32" : "scalar";
+}
+
+/*
+ * Keccak-f[1600] on n independent states stored lane-sliced: lane i of state
+ * j is states[i * n + j], i.e. a C-contiguous (25, n) array as used by
+ * keccak256_batch. Adjacent states sit in adjacent words, so each lane
+ * operation covers several states at once in a SIMD register.
+ *
+ * keccak_f1600_x8 is written once on 8-wide uint64 vectors (a GCC/clang
+ * extension). On x86 ELF targets the compiler also builds AVX2 and AVX-512
+ * clones of it and the dynamic loader binds the best one for the CPU the
+ * first time it is called; elsewhere it is lowered to whatever the target
+ * baseline offers, or to the scalar permutation without vector support.
+ */
+#if defined(__GNUC__) && !defined(__INTEL_COMPILER)
+
+#include <stddef.h>
+#include <string.h>
+
+typedef uint64_t lanes8 __attribute__((vector_size(64), aligned(8)));
+
+#if (defined(__x86_64__) || defined(__i386__)) && defined(__ELF__) && defined(__has_attribute)
+#if __has_attribute(target_clones)
+#define KECCAK_CLONES __attribute__((target_clones("avx512f", "avx2", "default")))
+#endif
+#endif
+#ifndef KECCAK_CLONES
+#define KECCAK_CLONES
+#endif
+
+#define ROL8(v, n) (((v) << (n)) | ((v) >> ((64 - (n)) & 63)))
+
+/* Permute the 8 states in columns j..j+7 of a (25, stride) array. */
+KECCAK_CLONES
+static void keccak_f1600_x8(uint64_t *states, size_t stride, size_t j)
+{
+    lanes8 a[25], c[5], d, t, u;
+    int round, x, y, i;
+
+    for (i = 0; i < 25; i++)
+        memcpy(&a[i], states + i * stride + j, sizeof(lanes8));
+
+    for (round = 0; round < 24; round++) {
+        for (x = 0; x < 5; x++)
+            c[x] = a[x] ^ a[x + 5] ^ a[x + 10] ^ a[x + 15] ^ a[x + 20];
+        for (x = 0; x < 5; x++) {
+            d = c[(x + 4) % 5] ^ ROL8(c[(x + 1) % 5], 1);
+            for (y = 0; y < 25; y += 5)
+                a[y + x] ^= d;
+        }
+
+        /* Unrolled so every rotate count is an immediate (vprolq). */
+        t = a[1];
+#pragma GCC unroll 24
+        for (i = 0; i < 24; i++) {
+            u = a[chain_lanes[i]];
+            a[chain_lanes[i]] = ROL8(t, chain_rotations[i]);
+            t = u;
+        }
+
+        for (y = 0; y < 25; y += 5) {
+            for (x = 0; x < 5; x++)
+                c[x] = a[y + x];
+            for (x = 0; x < 5; x++)
+                a[y + x] = c[x] ^ (~c[(x + 1) % 5] & c[(x + 2) % 5]);
+        }
+
+        a[0] ^= round_constants[round];
+    }
+
+    for (i = 0; i < 25; i++)
+        memcpy(states + i * stride + j, &a[i], sizeof(lanes8));
+}
+
+void keccak_f1600_columns(uint64_t *states, size_t n)
+{
+    uint64_t tail[25 * 8];
+    size_t j, i, k, rest = n % 8;
+
+    for (j = 0; j + 8 <= n; j += 8)
+        keccak_f1600_x8(states, n, j);
+    if (rest == 0)
+        return;
+
+    /* Run the last partial group through a zero-padded 8-wide copy. */
+    memset(tail, 0, sizeof(tail));
+    for (i = 0; i < 25; i++)
+        for (k = 0; k < rest; k++)
+            tail[i * 8 + k] = states[i * n + j + k];
+    keccak_f1600_x8(tail, 8, 0);
+    for (i = 0; i < 25; i++)
+        for (k = 0; k < rest; k++)
+            states[i * n + j + k] = tail[i * 8 + k];
+}
+
+#else
+
+#include <stddef.h>
+
+void keccak_f1600_columns(uint64_t *states, size_t n)
+{
+    uint64_t s[25];
+    size_t i, j;
+
+    for (j = 0; j < n; j++) {
+        for (i = 0; i < 25; i++)
+            s[i] = states[i * n + j];
+        keccak_f1600(s);
+        for (i = 0; i < 25; i++)
+            states[i * n + j] = s[i];
+    }
+}
+
+#endif
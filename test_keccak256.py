@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Known-answer tests for keccak256.py. Run with python -m unittest; the
+suite reruns itself under every KECCAK_BACKEND available here.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+from array import array
+
+import keccak256
+
+def pattern(n):
+    return bytes(i % 251 for i in range(n))
+
+# Message => keccak256 digest; 135/136/137 bytes straddle the 136-byte rate.
+KnownAnswers = [
+    (b"", "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"),
+    (b"2K53cuR1tY", "da45c9896fd340d0b2fe53eaa90c41c72da2e971249b2fbc788b445ee4fcd543"),
+    (pattern(135), "cbdfd9dee5faad3818d6b06f95a219fd290b0e1706f6a82e5a595b9ce9faca62"),
+    (pattern(136), "7ce759f1ab7f9ce437719970c26b0a66ff11fe3e38e17df89cf5d29c7d7f807e"),
+    (pattern(137), "ac73d4fae68b8453f764007c1a20ce95994187861f0c3227a3a8e99a73a3b1db"),
+    (pattern(1000), "af692982e84a5a9688359025660a7857cd28ee7c8d867cfa1677baf2e6d1f63b"),
+]
+
+class KeccakTest(unittest.TestCase):
+    def test_one_shot(self):
+        for data, expected in KnownAnswers:
+            self.assertEqual(keccak256.keccak256(data).hex(), expected, len(data))
+            self.assertEqual(keccak256.keccak256(bytearray(data)).hex(), expected, len(data))
+            self.assertEqual(keccak256.keccak256_hex(data), expected, len(data))
+
+    def test_chunked_update(self):
+        data, expected = KnownAnswers[-1]
+        for chunk in (1, 7, 135, 136, 137):
+            h = keccak256.KeccakHash()
+            for i in range(0, len(data), chunk):
+                h.update(data[i : i + chunk])
+            self.assertEqual(h.hexdigest(), expected, chunk)
+
+    def test_copy_then_fork(self):
+        h = keccak256.KeccakHash()
+        h.update(pattern(100))
+        g = h.copy()
+        h.update(pattern(135)[100:])
+        g.update(pattern(137)[100:])
+        self.assertEqual(h.hexdigest(), KnownAnswers[2][1])
+        self.assertEqual(g.hexdigest(), KnownAnswers[4][1])
+
+    def test_update_after_digest(self):
+        h = keccak256.KeccakHash()
+        h.update(pattern(50))
+        h.digest()
+        h.update(pattern(136)[50:])
+        self.assertEqual(h.hexdigest(), KnownAnswers[3][1])
+        self.assertEqual(h.hexdigest(), KnownAnswers[3][1])
+
+    def test_many(self):
+        self.assertEqual(keccak256.keccak256_many([]), [])
+        # Enough equal-length messages to take the batched paths as well.
+        messages = [data for data, _ in KnownAnswers] * 20
+        expected = [bytes.fromhex(digest) for _, digest in KnownAnswers] * 20
+        self.assertEqual(keccak256.keccak256_many(messages), expected)
+
+    def test_many_buffers_and_iterables(self):
+        # Multi-byte items: 1000 bytes are 250 items of an array("I").
+        data, digest = KnownAnswers[-1]
+        words = array("I")
+        words.frombytes(data)
+        expected = [bytes.fromhex(digest)] * 20
+        self.assertEqual(keccak256.keccak256_many([words] * 20), expected)
+        self.assertEqual(keccak256.keccak256_many(bytearray(data) for _ in range(20)), expected)
+
+    def test_many_groups_by_byte_length(self):
+        # 136 bytes as 17 array("Q") items must batch with the other
+        # one-block-plus messages, not with the sub-block ones.
+        lanes = array("Q")
+        lanes.frombytes(KnownAnswers[3][0])
+        messages = [lanes] * 16 + [KnownAnswers[4][0]] * 16 + [KnownAnswers[1][0]] * 16
+        expected = [bytes.fromhex(KnownAnswers[i][1]) for i in (3, 4, 1) for _ in range(16)]
+        self.assertEqual(keccak256.keccak256_many(messages), expected)
+
+    def test_batch_rejects_read_only_states(self):
+        np = keccak256.load_numpy()
+        if np is None:
+            self.skipTest("NumPy not installed")
+        data = bytes(25 * 2 * 8)
+        states = np.frombuffer(data, dtype=np.uint64).reshape(25, 2)
+        with self.assertRaises(ValueError):
+            keccak256.keccak_f_batch(states)
+        self.assertEqual(data, bytes(25 * 2 * 8))
+
+@unittest.skipIf("KECCAK_BACKEND" in os.environ, "already running under one backend")
+class BackendTest(unittest.TestCase):
+    def test_every_backend(self):
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in keccak256.Backends:
+            with self.subTest(backend=name):
+                env = dict(os.environ, KECCAK_BACKEND=name)
+                probe = subprocess.run(
+                    [sys.executable, "-c", "import keccak256"],
+                    cwd=here, env=env, capture_output=True, text=True,
+                )
+                if "is not available here" in probe.stderr:
+                    self.skipTest("%s backend not available" % name)
+                run = subprocess.run(
+                    [sys.executable, "-m", "unittest", "-q", "test_keccak256"],
+                    cwd=here, env=env, capture_output=True, text=True,
+                )
+                self.assertEqual(run.returncode, 0, run.stderr)
+
+if __name__ == "__main__":
+    unittest.main()